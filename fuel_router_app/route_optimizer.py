@@ -1,18 +1,231 @@
+import asyncio
+import concurrent.futures
+import math
+import threading
+import httpx
 import requests
+import numpy as np
+import orjson
 from django.core.cache import cache
-from typing import List, Dict, Tuple, Union, Optional
+from requests.adapters import HTTPAdapter
+from numba import njit
+from rtree import index
+from scipy.spatial import cKDTree
+from typing import Any, List, Dict, Tuple, Union, Optional
 from .models import FuelStation
-from geopy.distance import geodesic
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = EARTH_RADIUS_MILES * math.pi / 180
+CORRIDOR_MILES = 50
+NEAREST_SAMPLES = 8
+GEOCODE_CACHE_TIMEOUT = 30 * 86400
+ROUTE_CACHE_TIMEOUT = 7 * 86400
+
+
+@njit(cache=True)
+def _haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in miles between two points."""
+    lat1, lon1 = math.radians(lat1), math.radians(lon1)
+    lat2, lon2 = math.radians(lat2), math.radians(lon2)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+def _haversine_vec(lat0, lon0, lats, lons) -> np.ndarray:
+    """Great-circle distance in miles from (lat0, lon0) to every (lats, lons) pair."""
+    lat0, lon0 = np.radians(lat0), np.radians(lon0)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lats) * np.sin((lons - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def _to_unit_vectors(lats, lons) -> np.ndarray:
+    """Map (lat, lon) points onto the unit sphere so Euclidean nearest neighbours match great-circle ones."""
+    lats, lons = np.radians(lats), np.radians(lons)
+    return np.column_stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)))
+
+
+def _distance_to_polyline(lats, lons, line_lats, line_lons) -> np.ndarray:
+    """Approximate distance in miles from every (lats, lons) point to the nearest polyline segment.
+
+    Each segment is projected equirectangularly around its own mid-latitude, which is
+    accurate to well under a mile at corridor-sized distances.
+    """
+    if len(line_lats) < 2:
+        return _haversine_vec(line_lats[0], line_lons[0], lats, lons)
+
+    scale = np.cos(np.radians((line_lats[:-1] + line_lats[1:]) / 2))
+    ax, ay = line_lons[:-1] * scale, line_lats[:-1]
+    abx, aby = line_lons[1:] * scale - ax, line_lats[1:] - ay
+    px, py = lons[:, None] * scale, lats[:, None]
+
+    seg_len2 = abx ** 2 + aby ** 2
+    t = ((px - ax) * abx + (py - ay) * aby) / np.where(seg_len2 > 0, seg_len2, 1)
+    t = np.clip(t, 0, 1)
+    dx = px - (ax + t * abx)
+    dy = py - (ay + t * aby)
+    return np.sqrt(dx ** 2 + dy ** 2).min(axis=1) * MILES_PER_DEGREE
+
+
+@njit(cache=True)
+def _plan_stops(
+        sample_lat: np.ndarray,
+        sample_lon: np.ndarray,
+        cum_dist: np.ndarray,
+        sample_to_end: np.ndarray,
+        station_lat: np.ndarray,
+        station_lon: np.ndarray,
+        station_price: np.ndarray,
+        station_to_end: np.ndarray,
+        dist_matrix: np.ndarray,
+        nearest_sample: np.ndarray,
+        tank_range: float
+):
+    """Walk the sampled route and pick a refuelling station whenever range runs low.
+
+    dist_matrix[i, j] is the distance from sampled point i to station j and
+    nearest_sample[j] lists the sampled points closest to station j, nearest first. Returns the
+    chosen station indices, the range left at the checkpoint each was picked from,
+    the checkpoint-to-station distance, the distance from the start, and the sample
+    index and range where the vehicle got stranded (-1 if it never did).
+    """
+    n = len(sample_lat)
+    stop_station = np.empty(n, dtype=np.int64)
+    stop_range = np.empty(n, dtype=np.float64)
+    stop_distance = np.empty(n, dtype=np.float64)
+    stop_from_start = np.empty(n, dtype=np.float64)
+    n_stops = 0
+    remaining_range = tank_range
+
+    i = 0
+    while i < n:
+        if i > 0:
+            remaining_range -= cum_dist[i] - cum_dist[i-1]
+
+        dist_to_next = 50.0
+        if i < n - 1:
+            dist_to_next = cum_dist[i+1] - cum_dist[i]
+
+        if remaining_range < (tank_range * 0.40) or remaining_range < (dist_to_next + 20):
+            dist_to_end = sample_to_end[i]
+            if remaining_range >= dist_to_end:
+                i += 1
+                continue
+
+            search_radius = remaining_range * 0.95
+            if remaining_range < 50:
+                search_radius = remaining_range
+            dist_to_stations = dist_matrix[i]
+            # Score = price plus a penalty for the detour; out-of-range stations score inf.
+            scores = np.where(
+                dist_to_stations <= search_radius,
+                station_price + ((dist_to_stations + station_to_end) - dist_to_end) * 0.05,
+                np.inf
+            )
+            best_idx = np.argmin(scores) if len(scores) else -1
+
+            if best_idx >= 0 and scores[best_idx] < np.inf:
+                best_distance = dist_to_stations[best_idx]
+
+                stop_station[n_stops] = best_idx
+                stop_range[n_stops] = remaining_range
+                stop_distance[n_stops] = best_distance
+                stop_from_start[n_stops] = cum_dist[i] + best_distance # Approx
+                n_stops += 1
+
+                # Resume just past the nearest sample between the checkpoint and the first
+                # sample at least best_distance further along the route. This monotonic
+                # bound stops a later pass of the route near the same station from being
+                # taken as the stop; on a winding route it can only resume early, which
+                # counts fuel conservatively.
+                last_k = np.searchsorted(cum_dist, cum_dist[i] + best_distance)
+                best_k = i
+                for k in nearest_sample[best_idx]:
+                    if i <= k <= last_k and k < n:
+                        best_k = k
+                        break
+
+                if best_k < n - 1:
+                    i = best_k + 1
+                    dist_station_to_next = _haversine(
+                        station_lat[best_idx], station_lon[best_idx], sample_lat[i], sample_lon[i]
+                    )
+                    remaining_range = tank_range - dist_station_to_next + (cum_dist[i] - cum_dist[i-1])
+                    continue
+                else:
+                    remaining_range = tank_range
+                    i += 1
+                    continue
+
+            elif remaining_range < 20:
+                return (stop_station[:n_stops], stop_range[:n_stops], stop_distance[:n_stops],
+                        stop_from_start[:n_stops], i, remaining_range)
+
+        i += 1
+
+    return (stop_station[:n_stops], stop_range[:n_stops], stop_distance[:n_stops],
+            stop_from_start[:n_stops], -1, remaining_range)
 
 
 class RouteOptimizer:
+    # Shared so repeat calls reuse pooled keep-alive connections to Nominatim and OSRM.
+    _session = requests.Session()
+    _session.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=10))
+    _session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=10))
+
     def __init__(self):
         
         self.OSRM_BASE_URL = 'http://router.project-osrm.org'
         self.NOMINATIM_BASE_URL = 'https://nominatim.openstreetmap.org'
+        # Loaded on first use and kept for the life of the instance; restart the
+        # server after importing new stations.
+        self._stations_cache: Optional[Dict[str, Any]] = None
+        # One long-lived event loop thread owns the async client, so its pooled
+        # connections to Nominatim and OSRM are reused across requests.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop_lock = threading.Lock()
 
-    def geocode_location(self, location: str) -> Tuple[Optional[float], Optional[float]]:
-        """Convert location string to coordinates using Nominatim"""
+    def _submit_async(self, make_coro) -> concurrent.futures.Future:
+        """Schedule make_coro(client) on the optimizer's event loop thread"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+                self._client = httpx.AsyncClient(
+                    timeout=15,
+                    limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+                )
+        return asyncio.run_coroutine_threadsafe(make_coro(self._client), self._loop)
+
+    def _get_stations(self) -> Dict[str, Any]:
+        """Load all geocoded stations into column arrays plus an R-tree keyed on array position"""
+
+        if self._stations_cache is None:
+            # Plain tuples of just the needed columns skip building a model instance per row.
+            rows = list(
+                FuelStation.objects.filter(lat__isnull=False, lon__isnull=False)
+                .values_list('lat', 'lon', 'retail_price', 'opis_id', 'name')
+            )
+            station_index = index.Index()
+            for k, (lat, lon, *_) in enumerate(rows):
+                station_index.insert(k, (lon, lat, lon, lat))
+            self._stations_cache = {
+                'index': station_index,
+                'lats': np.fromiter((r[0] for r in rows), dtype=np.float64, count=len(rows)),
+                'lons': np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows)),
+                'prices': np.fromiter((float(r[2]) for r in rows), dtype=np.float64, count=len(rows)),
+                'ids': [r[3] for r in rows],
+                'names': [r[4] for r in rows]
+            }
+        return self._stations_cache
+
+    def _geocode_cache_key(self, location: str) -> str:
+        """Normalize case and whitespace so equivalent queries share a cache entry"""
+        return "geo:" + "_".join(location.lower().split())
+
+    def _geocode_request(self, location: str) -> Tuple[str, Dict[str, Union[str, int]], Dict[str, str]]:
+        """Build the Nominatim search URL, params and headers for a location"""
         url = f'{self.NOMINATIM_BASE_URL}/search'
         params = {
             'q': location,
@@ -23,11 +236,14 @@ class RouteOptimizer:
         headers = {
             'User-Agent': 'RouteOptimizer/1.0'
         }
-        response = requests.get(url, params=params, headers=headers)
-        if response.status_code != 200:
-            raise ValueError(f"Nominatim API request failed with status code {response.status_code}")
+        return url, params, headers
 
-        data = response.json()
+    def _parse_geocode(self, status_code: int, content: bytes) -> Tuple[Optional[float], Optional[float]]:
+        """Pick the first result with coordinates out of a Nominatim response"""
+        if status_code != 200:
+            raise ValueError(f"Nominatim API request failed with status code {status_code}")
+
+        data = orjson.loads(content)
         if not data:
             return None, None
 
@@ -38,18 +254,51 @@ class RouteOptimizer:
 
         return None, None
 
-    def get_route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> Dict[str, Union[float, List]]:
-        """Get route using OSRM"""
+    def geocode_location(self, location: str) -> Tuple[Optional[float], Optional[float]]:
+        """Convert location string to coordinates using Nominatim"""
+        cache_key = self._geocode_cache_key(location)
+        cached_coords = cache.get(cache_key)
+        if cached_coords is not None:
+            return cached_coords
 
-        
+        url, params, headers = self._geocode_request(location)
+        response = self._session.get(url, params=params, headers=headers, timeout=15)
+        coords = self._parse_geocode(response.status_code, response.content)
+        if coords[0] is not None:
+            cache.set(cache_key, coords, timeout=GEOCODE_CACHE_TIMEOUT)
+        return coords
+
+    async def async_geocode_location(self, client: httpx.AsyncClient, location: str) -> Tuple[Optional[float], Optional[float]]:
+        """Async version of geocode_location using a shared httpx client"""
+        cache_key = self._geocode_cache_key(location)
+        cached_coords = await cache.aget(cache_key)
+        if cached_coords is not None:
+            return cached_coords
+
+        url, params, headers = self._geocode_request(location)
+        response = await client.get(url, params=params, headers=headers)
+        coords = self._parse_geocode(response.status_code, response.content)
+        if coords[0] is not None:
+            await cache.aset(cache_key, coords, timeout=GEOCODE_CACHE_TIMEOUT)
+        return coords
+
+    def _route_cache_key(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> str:
+        """Round to ~10m so repeat trips between the same places share a cache entry"""
+        return f"osrm:{round(start_lat, 4)},{round(start_lon, 4)}->{round(end_lat, 4)},{round(end_lon, 4)}"
+
+    def _route_request(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> Tuple[str, Dict[str, str]]:
+        """Build the OSRM route URL and params between two points"""
         url = f'{self.OSRM_BASE_URL}/route/v1/driving/{start_lon},{start_lat};{end_lon},{end_lat}'
         params = {
-            'overview': 'full',
+            'overview': 'simplified',
             'geometries': 'geojson',
-            'steps': 'true'
+            'steps': 'false'
         }
-        response = requests.get(url, params=params)
-        data = response.json()
+        return url, params
+
+    def _parse_route(self, content: bytes) -> Dict[str, Union[float, List]]:
+        """Extract distance in miles and geometry from an OSRM route response"""
+        data = orjson.loads(content)
 
         if data['code'] != 'Ok':
             raise ValueError("Could not calculate route")
@@ -61,27 +310,82 @@ class RouteOptimizer:
 
         return {
             'distance': route['distance'] / 1609.34,  
-            'geometry': coordinates,
-            'steps': route['legs'][0]['steps']
+            'geometry': coordinates
         }
 
+    def get_route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> Dict[str, Union[float, List]]:
+        """Get route using OSRM"""
+        if None in (start_lat, start_lon, end_lat, end_lon):
+            raise ValueError("Could not calculate route")
 
-    def calculate_distance(self, point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
-        """Check the cache for a pre-calculated distance or calculate and cache it."""
+        cache_key = self._route_cache_key(start_lat, start_lon, end_lat, end_lon)
+        cached_route = cache.get(cache_key)
+        if cached_route is not None:
+            return cached_route
 
-        cache_key = f"distance_{point1[0]}_{point1[1]}_{point2[0]}_{point2[1]}"
-        cached_distance = cache.get(cache_key)
+        url, params = self._route_request(start_lat, start_lon, end_lat, end_lon)
+        response = self._session.get(url, params=params, timeout=15)
+        route_data = self._parse_route(response.content)
+        cache.set(cache_key, route_data, timeout=ROUTE_CACHE_TIMEOUT)
+        return route_data
 
-        if cached_distance is not None:
-            return cached_distance
+    async def async_get_route(
+            self,
+            client: httpx.AsyncClient,
+            start_lat: float,
+            start_lon: float,
+            end_lat: float,
+            end_lon: float
+    ) -> Dict[str, Union[float, List]]:
+        """Async version of get_route using a shared httpx client"""
+        cache_key = self._route_cache_key(start_lat, start_lon, end_lat, end_lon)
+        cached_route = await cache.aget(cache_key)
+        if cached_route is not None:
+            return cached_route
 
-        
-        distance = geodesic(point1, point2).miles
+        url, params = self._route_request(start_lat, start_lon, end_lat, end_lon)
+        response = await client.get(url, params=params)
+        route_data = self._parse_route(response.content)
+        await cache.aset(cache_key, route_data, timeout=ROUTE_CACHE_TIMEOUT)
+        return route_data
+
+    async def async_locate_and_route(
+            self,
+            client: httpx.AsyncClient,
+            start: str,
+            end: str
+    ) -> Tuple[Tuple[float, float], Tuple[float, float], Dict[str, Union[float, List]]]:
+        """Geocode both ends concurrently, then fetch the route"""
+        start_coords, end_coords = await asyncio.gather(
+            self.async_geocode_location(client, start),
+            self.async_geocode_location(client, end)
+        )
+        for location, coords in ((start, start_coords), (end, end_coords)):
+            if coords[0] is None:
+                raise ValueError(f"Could not geocode '{location}'")
+        route_data = await self.async_get_route(client, *start_coords, *end_coords)
+        return start_coords, end_coords, route_data
+
+    def locate_and_route(
+            self,
+            start: str,
+            end: str
+    ) -> Tuple[Tuple[float, float], Tuple[float, float], Dict[str, Union[float, List]]]:
+        """Blocking entry point for async_locate_and_route using the shared async client"""
+        future = self._submit_async(lambda client: self.async_locate_and_route(client, start, end))
+        try:
+            # Load the station arrays on this thread while the network calls are in flight.
+            self._get_stations()
+        except Exception:
+            future.cancel()
+            raise
+        return future.result()
+
+    def calculate_distance(self, point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
+        """Calculate the great-circle distance in miles between two (lat, lon) points"""
+
+        return _haversine(point1[0], point1[1], point2[0], point2[1])
 
-        
-        cache.set(cache_key, distance, timeout=86400)
-        return distance
-    
 
     def find_optimal_fuel_stops(
             self,
@@ -96,25 +400,9 @@ class RouteOptimizer:
 
         
         fuel_stops = []
-        remaining_range = tank_range
         last_stop_coords = start_coords
         
         
-        lats = [p[1] for p in route_coordinates]
-        lons = [p[0] for p in route_coordinates]
-        min_lat, max_lat = min(lats), max(lats)
-        min_lon, max_lon = min(lons), max(lons)
-        
-        
-        buffer = 1.0 
-        stations = list(FuelStation.objects.filter(
-            lat__gte=min_lat - buffer,
-            lat__lte=max_lat + buffer,
-            lon__gte=min_lon - buffer,
-            lon__lte=max_lon + buffer
-        ))
-
-        
         sample_interval = max(1, len(route_coordinates) // int(total_distance / 50)) if int(total_distance / 50) > 0 else 1
         sampled_points = route_coordinates[::sample_interval]
         
@@ -122,135 +410,81 @@ class RouteOptimizer:
         if sampled_points[-1] != route_coordinates[-1]:
             sampled_points.append(route_coordinates[-1])
 
-        i = 0
-        while i < len(sampled_points):
-            point = sampled_points[i]
-            
-            current_coords = (point[1], point[0])
+        # Everything below only depends on the fixed route geometry, so compute it up front.
+        sample_lats = np.array([p[1] for p in sampled_points], dtype=np.float64)
+        sample_lons = np.array([p[0] for p in sampled_points], dtype=np.float64)
+        segment_lengths = _haversine_vec(sample_lats[:-1], sample_lons[:-1], sample_lats[1:], sample_lons[1:])
+        cum_dist = np.concatenate([[0.0], np.cumsum(segment_lengths)])
+        sample_to_end = _haversine_vec(end_coords[0], end_coords[1], sample_lats, sample_lons)
+
+        # Query the index one route chunk at a time, then keep only the stations
+        # within the corridor around the sampled polyline.
+        all_stations = self._get_stations()
+        lat_buffer = CORRIDOR_MILES / MILES_PER_DEGREE
+        station_ids = set()
+        for k in range(0, len(route_coordinates), sample_interval):
+            chunk = route_coordinates[k:k + sample_interval + 1]
+            lats = [p[1] for p in chunk]
+            lons = [p[0] for p in chunk]
+            lon_buffer = lat_buffer / math.cos(math.radians(max(abs(lat) for lat in lats) + lat_buffer))
+            station_ids.update(all_stations['index'].intersection((
+                min(lons) - lon_buffer, min(lats) - lat_buffer,
+                max(lons) + lon_buffer, max(lats) + lat_buffer
+            )))
+        candidates = np.array(sorted(station_ids), dtype=np.int64)
+        near_route = _distance_to_polyline(
+            all_stations['lats'][candidates], all_stations['lons'][candidates], sample_lats, sample_lons
+        ) <= CORRIDOR_MILES
+        candidates = candidates[near_route]
+        station_lats = all_stations['lats'][candidates]
+        station_lons = all_stations['lons'][candidates]
+        station_prices = all_stations['prices'][candidates]
+        # Distance from each station to the destination doesn't depend on the checkpoint.
+        station_to_end = _haversine_vec(end_coords[0], end_coords[1], station_lats, station_lons)
+
+        dist_matrix = _haversine_vec(sample_lats[:, None], sample_lons[:, None], station_lats, station_lons)
+
+        # Which sampled points each station sits closest to doesn't depend on the checkpoint.
+        # Several neighbours are kept so the kernel can skip ones behind or beyond reach.
+        neighbours = min(NEAREST_SAMPLES, len(sampled_points))
+        _, nearest_sample = cKDTree(_to_unit_vectors(sample_lats, sample_lons)).query(
+            _to_unit_vectors(station_lats, station_lons), k=neighbours
+        )
+        nearest_sample = np.asarray(nearest_sample, dtype=np.int64).reshape(len(station_lats), neighbours)
+
+        stop_station, stop_range, stop_distance, stop_from_start, stranded_at, stranded_range = _plan_stops(
+            sample_lats, sample_lons, cum_dist, sample_to_end,
+            station_lats, station_lons, station_prices, station_to_end,
+            dist_matrix, nearest_sample, float(tank_range)
+        )
+        if stranded_at >= 0:
+            point = sampled_points[stranded_at]
+            raise ValueError(f"Unable to find fuel stations! Stranded at {(point[1], point[0])} with {stranded_range:.2f} miles range.")
+
+        for station_idx, range_left, distance, from_start in zip(stop_station, stop_range, stop_distance, stop_from_start):
+            row = candidates[station_idx]
+            price = float(all_stations['prices'][row])
             
-           
-            if i > 0:
-                prev_point = sampled_points[i-1]
-                dist_from_prev = self.calculate_distance((prev_point[1], prev_point[0]), current_coords)
-                remaining_range -= dist_from_prev
+            range_at_station = range_left - distance
+            gallons_to_fill = (tank_range - range_at_station) / mpg
             
+            # Cost for this fill-up
+            cost = price * gallons_to_fill
             
-            dist_from_start = self.calculate_distance(start_coords, current_coords)
-
-           
-            dist_to_next = 50 
-            if i < len(sampled_points) - 1:
-                 next_point = sampled_points[i+1]
-                 dist_to_next = self.calculate_distance(current_coords, (next_point[1], next_point[0]))
-
-            if remaining_range < (tank_range * 0.40) or remaining_range < (dist_to_next + 20):
-                
-                
-                dist_to_end = self.calculate_distance(current_coords, end_coords)
-                if remaining_range >= dist_to_end:
-                    i += 1
-                    continue 
-
-                
-                
-                search_radius = remaining_range * 0.95
-                if remaining_range < 50:
-                    search_radius = remaining_range 
-                nearby_stations = []
-                for station in stations:
-                    dist_to_station = self.calculate_distance(current_coords, (station.lat, station.lon))
-                    
-                    if dist_to_station <= search_radius:
-                       
-                        deviation = (
-                            (dist_to_station +
-                             self.calculate_distance((station.lat, station.lon), end_coords)) -
-                            dist_to_end
-                        )
-                        
-                        
-                        score = float(station.retail_price) + (deviation * 0.05)
-                        nearby_stations.append({
-                            'station': station,
-                            'distance': dist_to_station,
-                            'deviation': deviation,
-                            'score': score
-                        })
-
-                if nearby_stations:
-                    best_station = min(nearby_stations, key=lambda x: x['score'])
-                    station_obj = best_station['station']
-                    
-                    range_at_station = remaining_range - best_station['distance']
-                    gallons_to_fill = (tank_range - range_at_station) / mpg
-                    
-                    # Cost for this fill-up
-                    cost = float(station_obj.retail_price) * gallons_to_fill
-                    
-                    fuel_stops.append({
-                        'station_id': station_obj.opis_id,
-                        'name': station_obj.name,
-                        'location': {
-                            'lat': station_obj.lat,
-                            'lng': station_obj.lon
-                        },
-                        'price': float(station_obj.retail_price),
-                        'distance_from_start': dist_from_start + best_station['distance'], # Approx
-                        'gallons': gallons_to_fill,
-                        'cost': cost
-                    })
-                    
-                    
-                    last_stop_coords = (station_obj.lat, station_obj.lon)
-                    
-                    
-                    best_k = i
-                    min_d = float('inf')
-                   
-                    for k in range(i, len(sampled_points)):
-                         pt = sampled_points[k]
-                         d = self.calculate_distance((pt[1], pt[0]), (station_obj.lat, station_obj.lon))
-                         if d < min_d:
-                             min_d = d
-                             best_k = k
-                         else:
-                            
-                             if d > min_d + 50: 
-                                 break
-                    
-                    if best_k < len(sampled_points) - 1:
-                        
-                        i = best_k + 1
-                        
-                        
-                        next_pt = sampled_points[i]
-                        dist_station_to_next = self.calculate_distance(
-                            (station_obj.lat, station_obj.lon),
-                            (next_pt[1], next_pt[0])
-                        )
-                        
-                        
-                        
-                        prev_pt_resume = sampled_points[i-1]
-                        dist_prev_resume_to_next = self.calculate_distance(
-                            (prev_pt_resume[1], prev_pt_resume[0]),
-                            (next_pt[1], next_pt[0])
-                        )
-                        remaining_range = tank_range - dist_station_to_next + dist_prev_resume_to_next
-                        
-                        continue
-                    else:
-                        
-                        remaining_range = tank_range 
-                        i += 1
-                        continue
-
-                else:
-                    
-                    if remaining_range < 20:
-                        raise ValueError(f"Unable to find fuel stations! Stranded at {current_coords} with {remaining_range:.2f} miles range.")
+            fuel_stops.append({
+                'station_id': all_stations['ids'][row],
+                'name': all_stations['names'][row],
+                'location': {
+                    'lat': float(all_stations['lats'][row]),
+                    'lng': float(all_stations['lons'][row])
+                },
+                'price': price,
+                'distance_from_start': float(from_start),
+                'gallons': float(gallons_to_fill),
+                'cost': float(cost)
+            })
             
-            i += 1
+            last_stop_coords = (float(all_stations['lats'][row]), float(all_stations['lons'][row]))
 
         
         dist_last_stop_to_end = self.calculate_distance(last_stop_coords, end_coords)
@@ -261,9 +495,8 @@ class RouteOptimizer:
             final_price = fuel_stops[-1]['price']
         else:
             
-            if stations:
-                avg_price = sum(float(s.retail_price) for s in stations) / len(stations)
-                final_price = avg_price
+            if len(candidates):
+                final_price = float(station_prices.mean())
             else:
                 final_price = 3.50
         
@@ -7,6 +7,8 @@ class RouteResponseSerializer(serializers.Serializer):
     total_cost = serializers.DecimalField(max_digits=10, decimal_places=4)
     total_distance = serializers.FloatField()
     map_url = serializers.CharField()
+    map_status = serializers.CharField()
+    map_status_url = serializers.CharField()
 
 
 class RouteRequestSerializer(serializers.Serializer):
@@ -1,3 +1,182 @@
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+
+from fuel_router_app import views
+from fuel_router_app.models import FuelStation
+from fuel_router_app.route_optimizer import RouteOptimizer, _haversine
+
+
+def straight_route(start_lon, end_lon, lat=40.0, points=2001):
+    """An east-west route along one latitude as OSRM-style [lon, lat] pairs."""
+    step = (end_lon - start_lon) / (points - 1)
+    return [[start_lon + step * k, lat] for k in range(points)]
+
+
+class FindOptimalFuelStopsTests(TestCase):
+    def create_station(self, opis_id, lat, lon, price):
+        return FuelStation.objects.create(
+            opis_id=opis_id, name=f'Station {opis_id}', address='1 Main St', city='Town',
+            state='KS', rack_id=1, retail_price=price, lat=lat, lon=lon
+        )
+
+    def plan(self, route, tank_range=500, mpg=10):
+        start = (route[0][1], route[0][0])
+        end = (route[-1][1], route[-1][0])
+        total_distance = sum(_haversine(a[1], a[0], b[1], b[0]) for a, b in zip(route, route[1:]))
+        result = RouteOptimizer().find_optimal_fuel_stops(start, end, route, total_distance, tank_range, mpg)
+        return result, total_distance
+
+    def test_picks_cheapest_station_in_range(self):
+        self.create_station(1, 40.05, -94.0, '3.000')
+        self.create_station(2, 40.05, -93.0, '3.500')
+        self.create_station(3, 40.05, -87.0, '3.200')
+        self.create_station(4, 40.05, -86.5, '2.900')
+        # Cheapest of all, but far outside the corridor around the route.
+        self.create_station(5, 44.0, -90.0, '1.000')
+
+        result, total_distance = self.plan(straight_route(-100.0, -80.0))
+
+        stops = result['fuel_stops']
+        self.assertEqual([stop['station_id'] for stop in stops], [1, 4])
+        self.assertAlmostEqual(stops[0]['distance_from_start'], 317.94, places=2)
+        self.assertAlmostEqual(stops[0]['gallons'], 31.79, places=2)
+        self.assertAlmostEqual(stops[1]['distance_from_start'], 714.62, places=2)
+        self.assertAlmostEqual(stops[1]['gallons'], 39.72, places=2)
+        self.assertAlmostEqual(result['total_cost'], 310.29, places=2)
+        self.assertEqual(result['total_distance'], total_distance)
+
+    def test_raises_when_stranded(self):
+        self.create_station(5, 44.0, -90.0, '1.000')
+
+        with self.assertRaisesMessage(ValueError, 'Unable to find fuel stations!'):
+            self.plan(straight_route(-100.0, -80.0))
+
+    def test_short_route_uses_average_corridor_price(self):
+        self.create_station(1, 40.05, -99.0, '3.000')
+        self.create_station(2, 40.05, -98.5, '3.600')
+        self.create_station(5, 44.0, -98.0, '1.000')
+
+        result, _ = self.plan(straight_route(-100.0, -98.0, points=201))
+
+        # With no stop the last leg is start to end, priced at the corridor average.
+        self.assertEqual(result['fuel_stops'], [])
+        self.assertAlmostEqual(result['total_cost'], _haversine(40.0, -100.0, 40.0, -98.0) / 10 * 3.30, places=6)
+
+    def test_no_stations_uses_default_price(self):
+        result, _ = self.plan(straight_route(-100.0, -98.0, points=201))
+
+        self.assertEqual(result['fuel_stops'], [])
+        self.assertAlmostEqual(result['total_cost'], _haversine(40.0, -100.0, 40.0, -98.0) / 10 * 3.50, places=6)
+
+    def test_single_point_route(self):
+        self.create_station(1, 40.05, -99.0, '3.000')
+
+        result, _ = self.plan([[-100.0, 40.0]])
+
+        self.assertEqual(result['fuel_stops'], [])
+        self.assertEqual(result['total_cost'], 0)
+
+    def test_out_and_back_route_resumes_after_the_stop(self):
+        # Station 1 sits beside the return leg but is also within reach of the outbound
+        # leg, so the planner must not jump ahead to the return pass after stopping.
+        self.create_station(1, 40.32, -94.5, '3.000')
+        self.create_station(2, 40.3, -98.0, '3.100')
+        route = (
+            straight_route(-100.0, -92.0, points=801)
+            + [[-92.0, 40.0 + 0.01 * k] for k in range(1, 30)]
+            + straight_route(-92.0, -100.0, lat=40.3, points=801)
+        )
+
+        result, total_distance = self.plan(route)
+
+        stops = result['fuel_stops']
+        self.assertEqual([stop['station_id'] for stop in stops], [1, 2])
+        self.assertAlmostEqual(stops[0]['distance_from_start'], 326.20, places=2)
+        self.assertAlmostEqual(stops[1]['distance_from_start'], 727.45, places=2)
+        self.assertAlmostEqual(result['total_cost'], 266.96, places=2)
+        self.assertStopsWithinRange(stops, total_distance, tank_range=500, mpg=10)
+
+
+    def test_loop_route_keeps_stops_consistent_with_distance_driven(self):
+        # The route loops round and crosses its outbound leg beside station 1, so the
+        # station is near two parts of the route several hundred miles apart.
+        self.create_station(1, 40.03, -95.0, '3.000')
+        self.create_station(2, 41.95, -94.05, '3.100')
+        self.create_station(3, 39.5, -95.05, '3.100')
+        route = (
+            straight_route(-100.0, -94.0, points=601)
+            + [[-94.0, 40.0 + 0.01 * k] for k in range(1, 200)]
+            + straight_route(-94.0, -95.0, lat=42.0, points=101)
+            + [[-95.0, 42.0 - 0.01 * k] for k in range(1, 301)]
+            + straight_route(-95.0, -99.0, lat=39.0, points=401)[1:]
+        )
+
+        result, total_distance = self.plan(route)
+
+        self.assertEqual([stop['station_id'] for stop in result['fuel_stops']], [1, 3])
+        self.assertStopsWithinRange(result['fuel_stops'], total_distance, tank_range=500, mpg=10)
+
+    def assertStopsWithinRange(self, stops, total_distance, tank_range, mpg):
+        """Stops move forward along the route and no leg is longer than a full tank."""
+        positions = [0.0] + [stop['distance_from_start'] for stop in stops] + [total_distance]
+        for previous, current in zip(positions, positions[1:]):
+            self.assertLess(previous, current)
+            self.assertLessEqual(current - previous, tank_range)
+        for stop in stops:
+            self.assertLessEqual(stop['gallons'], tank_range / mpg)
+
+class MapFilesTests(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.maps_dir = Path(tmp_dir.name)
+        patcher = mock.patch.object(views, 'maps_dir', self.maps_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.map_id = uuid.uuid4()
+        self.map_file_path = self.maps_dir / f'{self.map_id.hex}.html'
+
+    def get_status(self, map_id):
+        return self.client.get(reverse('map-status', args=[map_id]))
+
+    def test_status_is_pending_until_the_map_is_written(self):
+        self.map_file_path.with_suffix('.pending').touch()
+        self.assertEqual(self.get_status(self.map_id).json()['map_status'], 'pending')
+
+        with mock.patch.object(views.RoutePlannerView, 'generate_map', return_value='<html></html>'):
+            views.RoutePlannerView().write_map(self.map_file_path, [], [])
+
+        self.assertEqual(self.get_status(self.map_id).json()['map_status'], 'ready')
+        self.assertEqual(os.stat(self.map_file_path).st_mode & 0o777, 0o666 & ~views._UMASK)
+        self.assertFalse(self.map_file_path.with_suffix('.pending').exists())
+
+    def test_status_is_failed_when_rendering_fails(self):
+        self.map_file_path.with_suffix('.pending').touch()
+
+        with mock.patch.object(views.RoutePlannerView, 'generate_map', side_effect=RuntimeError):
+            views.RoutePlannerView().write_map(self.map_file_path, [], [])
+
+        self.assertEqual(self.get_status(self.map_id).json()['map_status'], 'failed')
+        self.assertEqual(sorted(os.listdir(self.maps_dir)), [f'{self.map_id.hex}.failed'])
+
+    def test_unknown_map_is_not_found(self):
+        self.assertEqual(self.get_status(self.map_id).status_code, 404)
+
+    def test_remove_expired_maps_only_deletes_old_generated_files(self):
+        old = time.time() - views.MAP_TTL_SECONDS - 60
+        for name in (f'{uuid.uuid4().hex}.html', f'{uuid.uuid4().hex}.failed', 'map.html'):
+            path = self.maps_dir / name
+            path.touch()
+            os.utime(path, (old, old))
+        self.map_file_path.touch()
+
+        views.remove_expired_maps()
 
-# Create your tests here.
+        self.assertEqual(sorted(os.listdir(self.maps_dir)), sorted(['map.html', self.map_file_path.name]))
@@ -1,6 +1,7 @@
 from django.urls import path
-from fuel_router_app.views import RoutePlannerView
+from fuel_router_app.views import MapStatusView, RoutePlannerView
 
 urlpatterns = [
     path('plan-route/', RoutePlannerView.as_view(), name='plan-route'),
+    path('map-status/<uuid:map_id>/', MapStatusView.as_view(), name='map-status'),
 ]
\ No newline at end of file
@@ -4,11 +4,55 @@ from fuel_router_app.route_optimizer import RouteOptimizer
 import folium
 from fuel_router_app.serializers import RouteRequestSerializer, RouteResponseSerializer
 from decimal import Decimal
+from django.urls import reverse
 from django.conf import settings
 from folium.plugins import MarkerCluster
+from shapely.geometry import LineString
+import logging
 import os
+import re
+import tempfile
+import threading
+import time
+import uuid
 
-map_file_path = settings.BASE_DIR / 'maps/map.html'
+logger = logging.getLogger(__name__)
+
+maps_dir = settings.BASE_DIR / 'maps'
+
+# Per-request map files (and their status markers) are deleted after this long.
+MAP_TTL_SECONDS = 24 * 3600
+_MAP_FILE_RE = re.compile(r'^[0-9a-f]{32}\.(html|pending|failed)$|^tmp.*\.tmp$')
+
+# The umask can only be read by setting it, so do that once at import time.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def remove_expired_maps():
+    """Delete generated map files and status markers older than MAP_TTL_SECONDS"""
+    cutoff = time.time() - MAP_TTL_SECONDS
+    for entry in os.scandir(maps_dir):
+        if _MAP_FILE_RE.match(entry.name) and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def get_map_status(map_id):
+    """Return 'ready', 'pending' or 'failed' for a generated map, or None if it's unknown or expired"""
+    map_file_path = maps_dir / f'{map_id.hex}.html'
+    if map_file_path.exists():
+        return 'ready'
+    if map_file_path.with_suffix('.pending').exists():
+        return 'pending'
+    if map_file_path.with_suffix('.failed').exists():
+        return 'failed'
+    return None
+
+
+# Shared across requests so the station arrays, R-tree and HTTP client are only built once.
+_ROUTE_SERVICE = RouteOptimizer()
 
 
 class RoutePlannerView(APIView):
@@ -19,15 +63,11 @@ class RoutePlannerView(APIView):
 
         start = request_serializer.validated_data['start']
         end = request_serializer.validated_data['end']
-        route_service = RouteOptimizer()
+        route_service = _ROUTE_SERVICE
 
         try:
-            
-            start_lat, start_lon = route_service.geocode_location(start)
-            end_lat, end_lon = route_service.geocode_location(end)
-
-            # Get route from OSRM
-            route_data = route_service.get_route(start_lat, start_lon, end_lat, end_lon)
+            # Geocoding and OSRM calls run concurrently on one event loop
+            (start_lat, start_lon), (end_lat, end_lon), route_data = route_service.locate_and_route(start, end)
 
             
             result = route_service.find_optimal_fuel_stops(
@@ -35,20 +75,26 @@ class RoutePlannerView(APIView):
                 route_data['geometry'], route_data['distance'], tank_range=500, mpg=10
             )
 
-            # Generate map
-            map_html = self.generate_map(route_data['geometry'], result['fuel_stops'])
-
-           
-            os.makedirs(os.path.dirname(map_file_path), exist_ok=True)
-            with open(map_file_path, 'w') as file:
-                file.write(map_html)
+            # Render the map in the background to a file of its own. A .pending marker
+            # tracks it until the map is written (or a .failed marker replaces it).
+            map_id = uuid.uuid4()
+            map_file_path = maps_dir / f'{map_id.hex}.html'
+            os.makedirs(maps_dir, exist_ok=True)
+            map_file_path.with_suffix('.pending').touch()
+            threading.Thread(
+                target=self.write_map,
+                args=(map_file_path, route_data['geometry'], result['fuel_stops']),
+                daemon=True
+            ).start()
 
             response_data = {
                 'route_coordinates': route_data['geometry'],
                 'fuel_stops': result['fuel_stops'],
                 'total_cost': round(Decimal(result['total_cost']), 4),
                 'total_distance': result['total_distance'],
-                'map_url': str(map_file_path)
+                'map_url': str(map_file_path),
+                'map_status': 'pending',
+                'map_status_url': reverse('map-status', args=[map_id])
             }
 
             serializer = RouteResponseSerializer(data=response_data)
@@ -59,14 +105,37 @@ class RoutePlannerView(APIView):
         except Exception as e:
             return Response({'error': str(e)}, status=400)
 
+    def write_map(self, map_file_path, coordinates, fuel_stops):
+        remove_expired_maps()
+        tmp_path = None
+        try:
+            map_html = self.generate_map(coordinates, fuel_stops)
+
+            # Write to a temp file and swap it in so readers never see a partial map.
+            # mkstemp creates the file owner-only, so give it the usual umask mode first.
+            fd, tmp_path = tempfile.mkstemp(dir=maps_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as file:
+                file.write(map_html)
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+            os.replace(tmp_path, map_file_path)
+        except Exception:
+            logger.exception("Failed to write route map")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            map_file_path.with_suffix('.failed').touch()
+        finally:
+            map_file_path.with_suffix('.pending').unlink(missing_ok=True)
+
     def generate_map(self, coordinates, fuel_stops):
         
         map_center = coordinates[len(coordinates) // 2]
         m = folium.Map(location=[map_center[1], map_center[0]], zoom_start=14)
 
         
+        # Douglas-Peucker at ~50m is invisible on the map but drops most of the points.
+        line = LineString(coordinates).simplify(tolerance=0.0005, preserve_topology=False)
         folium.PolyLine(
-            [(lat, lon) for lon, lat in coordinates],
+            [(lat, lon) for lon, lat in line.coords],
             weight=5,
             color='blue',
             opacity=0.7
@@ -103,3 +172,15 @@ class RoutePlannerView(APIView):
             ).add_to(marker_cluster)
 
         return m._repr_html_()
+
+
+class MapStatusView(APIView):
+    def get(self, request, map_id):
+        map_status = get_map_status(map_id)
+        if map_status is None:
+            return Response({'error': 'Unknown or expired map'}, status=404)
+
+        return Response({
+            'map_status': map_status,
+            'map_url': str(maps_dir / f'{map_id.hex}.html')
+        })